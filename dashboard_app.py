@@ -1,6 +1,6 @@
+import os
 import streamlit as st
 import pandas as pd
-import json
 from streamlit_autorefresh import st_autorefresh
 
 # ---- MUST be FIRST Streamlit command ----
@@ -11,18 +11,25 @@ st_autorefresh(interval=10000, key="refresh-trades")
 
 LOG_FILE = "trade_log.jsonl"
 
-def load_trades():
+@st.cache_data(ttl=10, show_spinner=False)
+def _read_trades(path, mtime):
+    # mtime is part of the cache key, so an unchanged log is never re-parsed
     try:
-        with open(LOG_FILE, "r") as f:
-            return [json.loads(line) for line in f if line.strip()]
+        return pd.read_json(path, lines=True, convert_dates=False, dtype=False)
     except Exception:
-        return []
+        return pd.DataFrame()
+
+def load_trades():
+    try:
+        mtime = os.path.getmtime(LOG_FILE)
+    except OSError:
+        return pd.DataFrame()
+    return _read_trades(LOG_FILE, mtime)
 
 st.title("NIFTY Options Strategy Paper Trading Dashboard")
 
-trades = load_trades()
-if trades:
-    df = pd.DataFrame(trades)
+df = load_trades()
+if not df.empty:
     st.header("Trade Log")
     st.dataframe(df.tail(15), use_container_width=True)
 
@@ -34,10 +41,9 @@ if trades:
     st.metric("Number of Trades", len(df))
 
     # Open position info
-    open_pos = df[df["event"] == "OPEN"]
-    closed_pos = df[df["event"] == "CLOSE"]
-    if len(open_pos) > len(closed_pos):
-        last_open = open_pos.iloc[-1]
+    counts = df["event"].value_counts()
+    if counts.get("OPEN", 0) > counts.get("CLOSE", 0):
+        last_open = df.iloc[df["event"].eq("OPEN").to_numpy().nonzero()[0][-1]]
         st.info(
             f"**Current Open Position:** {last_open['side']} | Qty: {last_open['qty']} | Price: {last_open['entry_price']} | Contract: {last_open['contract']}"
         )
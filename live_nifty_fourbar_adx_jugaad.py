@@ -2,116 +2,200 @@ import os
 import math
 import time
 import json
+import socket
+import random
 import requests
-import pandas as pd
-from requests.adapters import HTTPAdapter, Retry
+from email.utils import parsedate_to_datetime
+import numpy as np
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta, timezone
 
 from jugaad_data.nse import NSELive
-from option_chain import get_strikes_payload, PaperBroker
+try:
+    from numba import njit
+except ImportError:  # numba is optional; run the ADX step as plain Python
+    def njit(*args, **kwargs):
+        return lambda f: f
+from option_chain import get_strikes_payload, get_lot_size, PaperBroker
 
 # -------- Config --------
 IST = timezone(timedelta(hours=5, minutes=30))
 INDEX_NAME = "NIFTY 50"
-SESSION_START = (9, 15)
-SESSION_END   = (15, 30)
+SESSION_START = 915   # HHMM, IST
+SESSION_END   = 1530
 STRIKE_STEP = 50
 ADX_PERIOD = 14
 ADX_THRESHOLD = 20.0
+BAR_CAPACITY = 512  # 15m bars kept in memory (~20 sessions)
+RETRY_ATTEMPTS = 5
+RETRY_BASE_SECS = 0.5        # safe_live backoff: base * 2**attempt, jittered
+RETRY_MAX_SECS = 30.0
+MSTAT_POLL_SECS = 60         # market_status re-check interval while open
+MSTAT_CLOSED_POLL_SECS = 300 # ... and after it last reported closed
 
 os.environ["NO_PROXY"] = "*"
 os.environ["no_proxy"] = "*"
 
 # -------- Network hardening --------
-def make_nse_session():
-    s = requests.Session()
-    s.headers.update({
-        "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) "
-                       "Chrome/124.0.0.0 Safari/537.36"),
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.nseindia.com/",
-        "Connection": "keep-alive",
-    })
-    retries = Retry(total=5, backoff_factor=1.5,
-                    status_forcelist=[429, 500, 502, 503, 504],
-                    allowed_methods=["GET", "HEAD"],
-                    raise_on_status=False)
-    s.mount("https://", HTTPAdapter(max_retries=retries))
-    try:
-        s.get("https://www.nseindia.com/", timeout=6)
-    except Exception:
-        pass
+class TunedHTTPAdapter(HTTPAdapter):
+    # keep idle pooled sockets alive; TCP_NODELAY is urllib3's default but is
+    # listed because socket_options replaces the defaults rather than extending them
+    SOCKET_OPTIONS = [
+        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+def tune_session(s):
+    # no transport-level retries: safe_live() is the only retry layer
+    s.mount("https://", TunedHTTPAdapter(max_retries=0, pool_connections=4, pool_maxsize=8))
+    s.stream = False
+    # NSELive only hands back r.json(); keep the raw response so safe_live()
+    # can see the status and Retry-After of a call that failed to parse
+    s.hooks["response"].append(lambda r, *args, **kwargs: setattr(s, "last_response", r))
     return s
 
 def build_nselive():
     n = NSELive()
     try:
-        n.session = make_nse_session()
+        # NSELive sends every request through n.s; tune it in place so it keeps
+        # its own headers and cookies
+        tune_session(n.s)
     except Exception:
         pass
     return n
 
+def _last_response(func):
+    # safe_live() wraps bound NSELive methods; their session is n.s
+    s = getattr(getattr(func, "__self__", None), "s", None)
+    return getattr(s, "last_response", None)
+
+def _retry_after(r):
+    # Retry-After in seconds (delta-seconds or HTTP date), or None if absent
+    val = r.headers.get("Retry-After") if r is not None else None
+    if not val:
+        return None
+    try:
+        return max(0.0, float(val))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(val).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
 def safe_live(func, *args, **kwargs):
-    for i in range(5):
+    # The only retry layer for NSE calls (tune_session() mounts no urllib3 retries).
+    # Connection errors, timeouts and 429/5xx replies are retried after the
+    # server's Retry-After, else with jittered exponential backoff, both capped
+    # at RETRY_MAX_SECS; anything else gives up at once. NSELive never raises
+    # HTTPError: a 429/5xx surfaces as a JSON decode error on its non-JSON body,
+    # so the status is read from the session's last response.
+    for i in range(RETRY_ATTEMPTS):
+        wait = None
         try:
             return func(*args, **kwargs)
-        except requests.exceptions.RequestException:
-            time.sleep(2.5 * (i+1))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            pass
+        except requests.exceptions.JSONDecodeError:
+            r = _last_response(func)
+            if r is not None and r.status_code != 429 and r.status_code < 500:
+                return None  # a bad payload, not throttling
+            wait = _retry_after(r)
         except Exception:
-            time.sleep(1.5 * (i+1))
+            return None
+        if i < RETRY_ATTEMPTS - 1:
+            if wait is None:
+                wait = RETRY_BASE_SECS * 2**i * random.uniform(0.5, 1.5)
+            time.sleep(min(RETRY_MAX_SECS, wait))
     return None
 
+# -------- Market status (throttled) --------
+_last_mstat_ts = 0.0
+_last_mstat_closed = False
+
+def market_closed(n):
+    # Session hours are fixed, so market_status is only needed to catch ad-hoc
+    # holidays/halts; poll it at most once per MSTAT_*_SECS and reuse the answer.
+    global _last_mstat_ts, _last_mstat_closed
+    ttl = MSTAT_CLOSED_POLL_SECS if _last_mstat_closed else MSTAT_POLL_SECS
+    if time.time() - _last_mstat_ts <= ttl:
+        return _last_mstat_closed
+    try:
+        mstat = safe_live(n.market_status) or {}
+        ms_list = mstat.get("marketState", []) if isinstance(mstat, dict) else []
+        cap = {x["market"]: x for x in ms_list if isinstance(x, dict) and "market" in x}.get("Capital Market", {})
+        is_closed = str(cap.get("marketStatus", "")).lower().startswith("close")
+    except Exception:
+        is_closed = False
+    _last_mstat_ts = time.time()
+    _last_mstat_closed = is_closed
+    return is_closed
+
 # -------- Time helpers --------
 def ist_now():
     return datetime.now(tz=IST)
 
 def in_session(ts):
-    return ts.weekday() < 5 and (ts.hour, ts.minute) >= SESSION_START and (ts.hour, ts.minute) <= SESSION_END
+    return ts.weekday() < 5 and SESSION_START <= ts.hour * 100 + ts.minute <= SESSION_END
 
 def floor_15m(ts):
-    mins = ts.minute - (ts.minute % 15)
-    return ts.replace(minute=mins, second=0, microsecond=0)
+    m = ts.minute
+    return ts.replace(minute=m - m % 15, second=0, microsecond=0)
+
+def to_dt64(ts):
+    # IST wall-clock time as naive datetime64[ns] (numpy has no tz support)
+    return np.datetime64(ts.replace(tzinfo=None), "ns")
 
 # -------- Minimal daily ADX tracker (incremental Wilder) --------
+# slots of the ADXTracker state vector
+_CLOSE, _HIGH, _LOW, _TR_S, _PDM_S, _MDM_S, _ADX = range(7)
+
+@njit(cache=True, fastmath=True)
+def _adx_step(state, high, low, close, p):
+    tr = max(high - low, abs(high - state[_CLOSE]), abs(low - state[_CLOSE]))
+    plus_dm = max(high - state[_HIGH], 0.0)
+    minus_dm = max(state[_LOW] - low, 0.0)
+    if plus_dm < minus_dm: plus_dm = 0.0
+    else: minus_dm = 0.0
+    tr_s = state[_TR_S] - (state[_TR_S]/p) + tr
+    pdm_s = state[_PDM_S] - (state[_PDM_S]/p) + plus_dm
+    mdm_s = state[_MDM_S] - (state[_MDM_S]/p) + minus_dm
+    plus_di = 100.0 * (pdm_s / tr_s) if tr_s else 0.0
+    minus_di = 100.0 * (mdm_s / tr_s) if tr_s else 0.0
+    dx = 100.0 * (abs(plus_di - minus_di) / (plus_di + minus_di)) if (plus_di + minus_di) else 0.0
+    adx = ((state[_ADX] * (p - 1)) + dx) / p if state[_ADX] else dx
+    state[_CLOSE] = close; state[_HIGH] = high; state[_LOW] = low
+    state[_TR_S] = tr_s; state[_PDM_S] = pdm_s; state[_MDM_S] = mdm_s; state[_ADX] = adx
+    return adx
+
 class ADXTracker:
     def __init__(self, period=14):
         self.p = period
         self.ready = False
-        self.prev = None
+        self._state = np.zeros(7)
+    @property
+    def prev_close(self):
+        return float(self._state[_CLOSE])
     def seed(self, close):
-        self.prev = {"close": float(close), "high": float(close), "low": float(close),
-                     "tr_s": 1e-9, "+dm_s": 0.0, "-dm_s": 0.0, "adx": 0.0}
+        self._state[:] = (close, close, close, 1e-9, 0.0, 0.0, 0.0)
         self.ready = True
     def update(self, high, low, close):
         if not self.ready:
             self.seed(close)
-        p = self.p
-        tr = max(high - low, abs(high - self.prev["close"]), abs(low - self.prev["close"]))
-        plus_dm = max(high - self.prev["high"], 0.0)
-        minus_dm = max(self.prev["low"] - low, 0.0)
-        if plus_dm < minus_dm: plus_dm = 0.0
-        else: minus_dm = 0.0
-        tr_s = self.prev["tr_s"] - (self.prev["tr_s"]/p) + tr
-        pdm_s = self.prev["+dm_s"] - (self.prev["+dm_s"]/p) + plus_dm
-        mdm_s = self.prev["-dm_s"] - (self.prev["-dm_s"]/p) + minus_dm
-        plus_di = 100.0 * (pdm_s / tr_s) if tr_s else 0.0
-        minus_di = 100.0 * (mdm_s / tr_s) if tr_s else 0.0
-        dx = 100.0 * (abs(plus_di - minus_di) / (plus_di + minus_di)) if (plus_di + minus_di) else 0.0
-        adx = ((self.prev["adx"] * (p - 1)) + dx) / p if self.prev["adx"] else dx
-        self.prev.update({"close": close, "high": high, "low": low, "tr_s": tr_s, "+dm_s": pdm_s, "-dm_s": mdm_s, "adx": adx})
-        return adx
+        return float(_adx_step(self._state, float(high), float(low), float(close), float(self.p)))
 
 # -------- 4-bar Darvas-style breakout on 15m --------
-def four_bar_signal(df_15m: pd.DataFrame):
-    if len(df_15m) < 4:
+def four_bar_signal(close4: np.ndarray, high4: np.ndarray, low4: np.ndarray):
+    # close4/high4/low4: the last 4 completed bars, oldest first
+    if len(close4) < 4:
         return None
-    last4 = df_15m.tail(4)
-    c = last4["close"].values; h = last4["high"].values; l = last4["low"].values
-    inc = all(c[i] > c[i-1] for i in range(1,4))
-    dec = all(c[i] < c[i-1] for i in range(1,4))
-    box_high = float(max(h)); box_low = float(min(l))
+    d = np.diff(close4)
+    inc = bool((d > 0).all())
+    dec = bool((d < 0).all())
+    box_high = float(high4.max()); box_low = float(low4.min())
     if inc:
         return {"dir":"LONG",  "trigger":box_high, "box_high":box_high, "box_low":box_low}
     if dec:
@@ -121,24 +205,24 @@ def four_bar_signal(df_15m: pd.DataFrame):
 # -------- Runner --------
 def run():
     n = build_nselive()
-    bars = pd.DataFrame(columns=["datetime","open","high","low","close"])
+    # 15m OHLC bars as parallel arrays; bars [0, n_bars) are valid, oldest first
+    bars_dt = np.empty(BAR_CAPACITY, dtype="datetime64[ns]")
+    bars_o = np.empty(BAR_CAPACITY, dtype=np.float64)
+    bars_h = np.empty(BAR_CAPACITY, dtype=np.float64)
+    bars_l = np.empty(BAR_CAPACITY, dtype=np.float64)
+    bars_c = np.empty(BAR_CAPACITY, dtype=np.float64)
+    n_bars = 0
+    last_slot_ns = -1  # epoch ns of the newest bar's slot
     last_completed = None
     adx = ADXTracker(ADX_PERIOD)
-    broker = PaperBroker(initial_capital=100000, log_file="trade_log.jsonl", slippage_pct=0.001)
+    broker = PaperBroker(initial_capital=100000, log_file="trade_log.jsonl", slippage_pct=0.001,
+                         lot_size=get_lot_size("NIFTY"))
     print("Live NIFTY 15m Darvas + ADX(14) | CE on up-breakout, PE on breakdown")
 
     while True:
         nowi = ist_now()
-        # market state check
-        try:
-            mstat = safe_live(n.market_status) or {}
-            ms_list = mstat.get("marketState", []) if isinstance(mstat, dict) else []
-            cap = next((x for x in ms_list if x.get("market") == "Capital Market"), ms_list if ms_list else {})
-            is_closed = str(cap.get("marketStatus", "")).lower().startswith("close")
-        except Exception:
-            is_closed = False
-
-        if not in_session(nowi) or is_closed:
+        # market state check (outside session hours no NSE call is needed)
+        if not in_session(nowi) or market_closed(n):
             print(f"[{nowi.strftime('%a %H:%M:%S')}] Market CLOSED; sleeping 60s.")
             time.sleep(60); continue
 
@@ -150,16 +234,23 @@ def run():
 
         # 15m aggregation
         slot = floor_15m(nowi)
-        if len(bars) == 0 or pd.Timestamp(bars["datetime"].iloc[-1]).to_pydatetime().replace(tzinfo=IST) < slot:
-            bars = pd.concat([bars, pd.DataFrame([{
-                "datetime": pd.Timestamp(slot), "open": spot, "high": spot, "low": spot, "close": spot
-            }])], ignore_index=True)
+        slot_ns = int(slot.timestamp()) * 1_000_000_000  # slots are whole minutes
+        if slot_ns > last_slot_ns:
+            if n_bars == BAR_CAPACITY:
+                # buffer full: keep the newest half so slices stay contiguous
+                keep = BAR_CAPACITY // 2
+                for arr in (bars_dt, bars_o, bars_h, bars_l, bars_c):
+                    arr[:keep] = arr[n_bars-keep:n_bars]
+                n_bars = keep
+            bars_dt[n_bars] = to_dt64(slot)
+            bars_o[n_bars] = bars_h[n_bars] = bars_l[n_bars] = bars_c[n_bars] = spot
+            n_bars += 1
+            last_slot_ns = slot_ns
         else:
-            bars.loc[bars.index[-1], ["high","low","close"]] = [
-                max(bars.loc[bars.index[-1], "high"], spot),
-                min(bars.loc[bars.index[-1], "low"],  spot),
-                spot,
-            ]
+            last = n_bars - 1
+            bars_h[last] = max(bars_h[last], spot)
+            bars_l[last] = min(bars_l[last], spot)
+            bars_c[last] = spot
 
         # evaluate on completed bar
         completed = slot - timedelta(minutes=15)
@@ -167,17 +258,19 @@ def run():
             last_completed = completed
 
             # approximate daily ADX update
-            prev_close = adx.prev["close"] if adx.ready else spot
-            day_high = max(prev_close, float(bars["high"].iloc[-1]))
-            day_low  = min(prev_close, float(bars["low"].iloc[-1]))
-            day_close = float(bars["close"].iloc[-1])
+            prev_close = adx.prev_close if adx.ready else spot
+            day_high = max(prev_close, float(bars_h[n_bars-1]))
+            day_low  = min(prev_close, float(bars_l[n_bars-1]))
+            day_close = float(bars_c[n_bars-1])
             adx_val = adx.update(day_high, day_low, day_close)
-            df_comp = bars[bars["datetime"] <= pd.Timestamp(completed)].copy()
-            sig = four_bar_signal(df_comp) if len(df_comp) >= 4 else None
+            n_comp = int(np.searchsorted(bars_dt[:n_bars], to_dt64(completed), side="right"))
+            sig = four_bar_signal(bars_c[n_comp-4:n_comp], bars_h[n_comp-4:n_comp],
+                                  bars_l[n_comp-4:n_comp]) if n_comp >= 4 else None
+            strikes = None  # option chain, fetched at most once per evaluated bar
 
             # ---- ENTRY logic (on SIGNAL, during market, no open position) ----
             if sig and adx_val > ADX_THRESHOLD and broker.position is None:
-                strikes = get_strikes_payload()
+                strikes = get_strikes_payload(n, spot=spot)
                 oc_leg = None
                 price = None
                 if strikes.get("status") == "OK":
@@ -192,7 +285,7 @@ def run():
             # ---- EXIT logic (example: close on opposite signal, add your own SL/TP as needed) ----
             if broker.position is not None:
                 # Always get latest option leg for the open position type
-                strikes = get_strikes_payload()
+                strikes = strikes or get_strikes_payload(n, spot=spot)
                 if broker.position["side"] == "LONG":
                     oc_leg = strikes["calls"]["ATM"] or strikes["calls"]["OTM1"]
                     price = oc_leg["bid"] if oc_leg and oc_leg.get("bid", 0) > 0 else None
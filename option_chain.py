@@ -1,9 +1,25 @@
 import math
 import json
+import bisect
+import time
+import threading
+from functools import lru_cache
 from typing import Tuple, Dict, List, Optional, Any
 from jugaad_data.nse import NSELive  # live NSE endpoints (index + option chain)
 
 STRIKE_STEP = 50  # NIFTY strike increment
+CHAIN_TTL = 5     # seconds a fetched option chain is reused
+
+_nse = None  # shared default client, reused across calls
+_nse_lock = threading.Lock()
+
+def _client() -> NSELive:
+    global _nse
+    if _nse is None:
+        with _nse_lock:
+            if _nse is None:
+                _nse = NSELive()
+    return _nse
 
 def _round_to_step(x: float, step: int = 50) -> int:
     return int(round(x / step) * step)
@@ -34,24 +50,19 @@ def _fetch_chain(n: NSELive) -> Dict:
 def _build_chain_lookup(oc_json: Dict) -> Tuple[Dict, str, List[int]]:
     records = oc_json.get("records", {})
     expiry = records.get("expiryDates", [""])[0]  # nearest expiry
-    chain = {}
-    for row in records.get("data", []):
-        k = row.get("strikePrice")
-        if k is None:
-            continue
-        ce = row.get("CE", {})
-        pe = row.get("PE", {})
-        if k not in chain:
-            chain[k] = {}
-        if ce:
-            chain[k]["CE"] = ce
-        if pe:
-            chain[k]["PE"] = pe
-    strikes = sorted(chain.keys())
-    return chain, expiry, strikes
+    rows = records.get("data", [])
+    ce_by_k = {row["strikePrice"]: row["CE"] for row in rows if row.get("strikePrice") is not None and row.get("CE")}
+    pe_by_k = {row["strikePrice"]: row["PE"] for row in rows if row.get("strikePrice") is not None and row.get("PE")}
+    strikes = sorted(ce_by_k.keys() | pe_by_k.keys())
+    return {"CE": ce_by_k, "PE": pe_by_k}, expiry, strikes
+
+@lru_cache(maxsize=1)
+def _cached_chain_lookup(n: NSELive, bucket: int) -> Tuple[Dict, str, List[int]]:
+    # `bucket` is time.time() // CHAIN_TTL, so the chain is refetched at most once per window
+    return _build_chain_lookup(_fetch_chain(n))
 
 def _pick(chain: Dict, side: str, strike: int, expiry: str) -> Optional[Dict[str, Any]]:
-    leg = chain.get(strike, {}).get(side, {})
+    leg = chain[side].get(strike)
     if not leg:
         return None
     return {
@@ -66,24 +77,28 @@ def _pick(chain: Dict, side: str, strike: int, expiry: str) -> Optional[Dict[str
         "symbol": "NIFTY"
     }
 
-def get_strikes_payload() -> Dict:
+def get_strikes_payload(nselive: Optional[NSELive] = None, spot: Optional[float] = None) -> Dict:
     """
     Returns a dict with:
       - spot, expiry, atm
       - calls: ATM, ITM1, ITM2, OTM1, OTM2
       - puts:  ATM, ITM1, ITM2, OTM1, OTM2
+    Pass `nselive` to reuse an existing client; otherwise a shared default one is used.
+    Pass `spot` if the caller already has it, to skip the live_index request.
+    The option chain is cached for CHAIN_TTL seconds.
     """
-    n = NSELive()  # default client
-    spot = _get_nifty_spot(n)
+    n = nselive or _client()
+    if not spot:
+        spot = _get_nifty_spot(n)
     if not spot:
         return {"status": "ERROR", "reason": "No NIFTY spot available"}
 
-    oc = _fetch_chain(n)
-    chain, expiry, strikes = _build_chain_lookup(oc)
+    chain, expiry, strikes = _cached_chain_lookup(n, int(time.time() // CHAIN_TTL))
 
     atm = _round_to_step(spot, STRIKE_STEP)
     if atm not in strikes:
-        atm = min(strikes, key=lambda k: abs(k - spot))  # snap to closest available strike
+        i = bisect.bisect_left(strikes, spot)  # strikes is sorted; only its neighbours can be closest
+        atm = min(strikes[max(0, i-1):i+1], key=lambda k: abs(k - spot))  # snap to closest available strike
 
     ce_targets = [atm, atm - STRIKE_STEP, atm - 2*STRIKE_STEP, atm + STRIKE_STEP, atm + 2*STRIKE_STEP]
     pe_targets = [atm, atm + STRIKE_STEP, atm + 2*STRIKE_STEP, atm - STRIKE_STEP, atm - 2*STRIKE_STEP]
@@ -113,7 +128,15 @@ if __name__ == "__main__":
     print(json.dumps(get_strikes_payload(), indent=2))
 
 # --- PaperBroker and helper, add below your functions ---
+import atexit
 from datetime import datetime
+try:
+    import orjson
+    def _dumps(record) -> bytes:
+        return orjson.dumps(record)
+except ImportError:  # orjson is optional; stdlib json is just slower
+    def _dumps(record) -> bytes:
+        return json.dumps(record).encode()
 
 NSE_LOT_SIZE = {
     "NIFTY": 50,
@@ -124,7 +147,7 @@ def get_lot_size(symbol):
     return NSE_LOT_SIZE.get(symbol.upper(), 50)  # Default fallback
 
 class PaperBroker:
-    def __init__(self, initial_capital=100000, log_file="trade_log.jsonl", slippage_pct=0.001):
+    def __init__(self, initial_capital=100000, log_file="trade_log.jsonl", slippage_pct=0.001, lot_size=50):
         self.initial_capital = initial_capital
         self.capital = initial_capital
         self.position = None  # {"side": "LONG"/"SHORT", "entry": ..., "qty": ..., "contract": {...}}
@@ -132,20 +155,27 @@ class PaperBroker:
         self.closed_trades = []  # list of dicts
         self.log_file = log_file
         self.slippage_pct = slippage_pct
+        self.lot_size = lot_size  # broker trades a single symbol; see get_lot_size() for others
+        # fill = price * multiplier; slippage always moves the fill against us
+        self._long_entry_mul = 1 + slippage_pct
+        self._short_entry_mul = 1 - slippage_pct
+        self._long_exit_mul = 1 - slippage_pct
+        self._short_exit_mul = 1 + slippage_pct
+        self._fh = open(self.log_file, "ab", buffering=0)  # kept open, one write() per event
+        atexit.register(self._fh.close)
 
     def enter(self, side, price, contract, timestamp=None):
         if self.position is not None:
             self.log_event("REJECTED", "Already in position")
             return False
         
-        lot_size = get_lot_size(contract.get("symbol", "NIFTY"))
-        qty = lot_size
+        qty = self.lot_size
         cost = price * qty
         if self.capital < cost:
             self.log_event("REJECTED", f"Insufficient capital for trade: have {self.capital:.2f}, need {cost:.2f}")
             return False
 
-        fill_price = price + (self.slippage_pct * price if side == "LONG" else -self.slippage_pct * price)
+        fill_price = price * (self._long_entry_mul if side == "LONG" else self._short_entry_mul)
         self.position = {
             "side": side,
             "entry": fill_price,
@@ -173,7 +203,7 @@ class PaperBroker:
         entry = self.position["entry"]
         contract = self.position["contract"]
 
-        fill_price = price - (self.slippage_pct * price if side == "LONG" else -self.slippage_pct * price)
+        fill_price = price * (self._long_exit_mul if side == "LONG" else self._short_exit_mul)
 
         if side == "LONG":
             pnl = (fill_price - entry) * lot
@@ -219,8 +249,7 @@ class PaperBroker:
         }
         if extra:
             record.update(extra)
-        with open(self.log_file, "a") as f:
-            f.write(json.dumps(record) + "\n")
+        self._fh.write(_dumps(record) + b"\n")
 
     def summary(self):
         total_pnl = sum(trade["pnl"] for trade in self.closed_trades)